@@ -1,108 +1,564 @@
+import atexit
+import ctypes
 import socket
 import time
+import errno
 import logging
+import logging.handlers
+import os
+import queue
+import selectors
+import signal
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
+KEEPALIVE_CMD = b"\x1b@\x1bA\x1bZ"  # SBPL keep-alive
 
-def discover_printer_ports(ip: str, timeout: int = 2) -> List[int]:
+# Candidate ports, most preferred first
+_COMMON_PRINTER_PORTS = (9100, 631, 515, 721, 9101, 9102, 9103, 23, 80, 443)
+
+_TEST_COMMANDS = (
+    KEEPALIVE_CMD,  # SBPL keep-alive
+    b"\x1b@",        # ESC @ (Initialize printer)
+    b"\r\n",         # Simple carriage return
+)
+
+# SNMPv1 GetRequest for sysUpTime.0 (1.3.6.1.2.1.1.3.0), community "public"
+SNMP_GET_UPTIME = (
+    b"\x30\x26"                  # Message SEQUENCE
+    b"\x02\x01\x00"              # version: SNMPv1
+    b"\x04\x06public"            # community
+    b"\xa0\x19"                  # GetRequest PDU
+    b"\x02\x01\x01"              # request-id
+    b"\x02\x01\x00\x02\x01\x00"  # error-status, error-index
+    b"\x30\x0e\x30\x0c"          # variable-bindings, VarBind
+    b"\x06\x08\x2b\x06\x01\x02\x01\x01\x03\x00"  # OID
+    b"\x05\x00"                  # NULL value
+)
+_SNMP_PORT = 161
+
+# Seconds allowed for a connect or SNMP reply; generous so a sleeping printer can wake
+CONNECT_TIMEOUT = 5
+# Seconds allowed to send the keep-alive once connected; a few bytes into an
+# empty send buffer never take this long unless the connection is dead
+SEND_TIMEOUT = 0.5
+# Consecutive SNMP failures before falling back to the TCP/SBPL keep-alive
+SNMP_MAX_FAILURES = 3
+
+# Background log writer shared by every PrinterKeepAlive (see setup_logging)
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+# connect_ex results meaning a non-blocking connect is under way (or done)
+_CONNECT_PENDING = {
+    0,
+    errno.EINPROGRESS,
+    errno.EWOULDBLOCK,
+    getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK),
+}
+
+
+def _start_connects(ip: str, ports, data) -> selectors.BaseSelector:
+    """Start a non-blocking connect to every port, registered on a new selector
+
+    Each socket waits for EVENT_WRITE with data(port) as its selector data.
+    Ports whose connect fails immediately are not registered.
+    """
+    sel = selectors.DefaultSelector()
+    try:
+        family, socktype, proto, _, addr = socket.getaddrinfo(
+            ip, 0, type=socket.SOCK_STREAM
+        )[0]
+        for port in ports:
+            sock = socket.socket(family, socktype, proto)
+            sock.setblocking(False)
+            if sock.connect_ex((addr[0], port) + addr[2:]) in _CONNECT_PENDING:
+                sel.register(sock, selectors.EVENT_WRITE, data(port))
+            else:
+                sock.close()
+    except BaseException:
+        _close_selector(sel)
+        raise
+    return sel
+
+
+def _close_selector(sel: selectors.BaseSelector):
+    """Close a selector and every socket still registered on it"""
+    for key in list(sel.get_map().values()):
+        key.fileobj.close()
+    sel.close()
+
+
+def discover_printer_ports(
+    ip: str, timeout: int = 2, verbose: bool = True
+) -> List[int]:
     """Discover open ports on the printer that might accept print jobs"""
-    common_printer_ports = [9100, 631, 515, 721, 9101, 9102, 9103, 23, 80, 443]
-    open_ports = []
+    common_printer_ports = _COMMON_PRINTER_PORTS
+    is_open = dict.fromkeys(common_printer_ports, False)
+
+    if verbose:
+        print(f"Scanning {ip} for open printer ports...")
+    sel = None
+    try:
+        # Start every connect at once, then wait for all of them in one selector
+        sel = _start_connects(ip, common_printer_ports, lambda port: port)
+        deadline = time.monotonic() + timeout
+        while sel.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in sel.select(remaining):
+                sock = key.fileobj
+                # A finished connect is writable; SO_ERROR tells success from refusal
+                is_open[key.data] = (
+                    sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                )
+                sel.unregister(sock)
+                sock.close()
+    except socket.error:
+        pass
+    finally:
+        if sel is not None:
+            _close_selector(sel)
+
+    if verbose:
+        for port in common_printer_ports:
+            print(f"  Port {port}: {'OPEN' if is_open[port] else 'CLOSED'}")
+    return [port for port in common_printer_ports if is_open[port]]
 
-    print(f"Scanning {ip} for open printer ports...")
-    for port in common_printer_ports:
-        try:
-            with socket.create_connection((ip, port), timeout=timeout) as sock:
-                open_ports.append(port)
-                print(f"  Port {port}: OPEN")
-        except (socket.timeout, socket.error):
-            print(f"  Port {port}: CLOSED")
 
-    return open_ports
+def setup_logging(handlers: Optional[List[logging.Handler]] = None):
+    """Set up process-wide logging once, with I/O on a listener thread
+
+    handlers default to printer_keepalive.log plus the console.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    if handlers is None:
+        handlers = [
+            logging.FileHandler("printer_keepalive.log"),
+            logging.StreamHandler(sys.stdout),
+        ]
+    log_queue = queue.Queue(-1)
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    # Flush queued records when the interpreter exits
+    atexit.register(stop_logging)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",  # Timestamps are added by the listener handlers
+        handlers=[logging.handlers.QueueHandler(log_queue)],
+    )
+
+
+def stop_logging():
+    """Flush queued log records and stop the listener thread, if running"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def open_snmp_socket(ip: str) -> socket.socket:
+    """Open a UDP socket connected to the printer's SNMP agent"""
+    family, socktype, proto, _, addr = socket.getaddrinfo(
+        ip, _SNMP_PORT, type=socket.SOCK_DGRAM
+    )[0]
+    sock = socket.socket(family, socktype, proto)
+    try:
+        # Connecting a UDP socket lets ICMP port-unreachable surface as an error
+        sock.connect(addr)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def send_snmp_probe(sock: socket.socket):
+    """Send an SNMP sysUpTime GET on a blocking socket and wait for any reply"""
+    sock.settimeout(CONNECT_TIMEOUT)
+    sock.send(SNMP_GET_UPTIME)
+    sock.recv(1500)  # Any reply proves the printer is awake
+
+
+def configure_socket(sock):
+    """Disable Nagle on a printer connection"""
+    # Send the tiny keep-alive payload immediately instead of waiting on Nagle
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
 
 def test_printer_communication(ip: str, port: int) -> bool:
     """Test if we can communicate with the printer on a specific port"""
-    test_commands = [
-        b"\x1b@\x1bA\x1bZ",  # SBPL keep-alive
-        b"\x1b@",            # ESC @ (Initialize printer)
-        b"\r\n",             # Simple carriage return
-    ]
-
     print(f"Testing communication with {ip}:{port}...")
-    for i, cmd in enumerate(test_commands):
-        try:
-            with socket.create_connection((ip, port), timeout=3) as sock:
+    resp_buf = bytearray(1024)  # Reused across probes within this call
+    sock = None
+    try:
+        for i, cmd in enumerate(_TEST_COMMANDS):
+            try:
+                # Share one connection across probes; only reopen after an error
+                if sock is None:
+                    sock = socket.create_connection((ip, port), timeout=3)
+                    sock.settimeout(1)
                 sock.sendall(cmd)
-                sock.settimeout(1)
                 try:
-                    response = sock.recv(1024)
+                    n = sock.recv_into(resp_buf)
+                    response = memoryview(resp_buf)[:n]
                     print(
-                        f"  Command {i+1}: SUCCESS (got response: {response[:20]}...)"
+                        f"  Command {i+1}: SUCCESS (got response: {bytes(response[:20])}...)"
                     )
                     return True
                 except socket.timeout:
                     print(f"  Command {i+1}: SENT (no response expected)")
                     return True
-        except Exception as e:
-            print(f"  Command {i+1}: FAILED ({e})")
+            except Exception as e:
+                print(f"  Command {i+1}: FAILED ({e})")
+                if sock is not None:
+                    sock.close()
+                    sock = None
+    finally:
+        if sock is not None:
+            sock.close()
 
     return False
 
 
+def _set_thread_affinity_mask(mask: int) -> int:
+    """Set the calling thread's affinity mask on Windows; return the old mask"""
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.GetCurrentThread.restype = ctypes.c_void_p
+    kernel32.SetThreadAffinityMask.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+    kernel32.SetThreadAffinityMask.restype = ctypes.c_size_t
+    previous = kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), mask)
+    if not previous:
+        raise ctypes.WinError(ctypes.get_last_error())
+    return previous
+
+
+def pin_current_thread(core: Optional[int], logger: logging.Logger):
+    """Pin the calling thread to core (Linux and Windows only)
+
+    Returns the previous affinity for restore_thread_affinity, or None if
+    the thread was not pinned. On Linux, threads started afterwards inherit
+    the pin; on Windows they get the process affinity.
+    """
+    if core is None or (os.cpu_count() or 1) <= 1:
+        return None
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            previous = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, {core})
+            return previous
+        if sys.platform == "win32":
+            return _set_thread_affinity_mask(1 << core)
+        logger.warning("Thread pinning is not supported on this platform")
+    except OSError as e:
+        logger.warning(f"Could not pin thread to core {core}: {e}")
+    return None
+
+
+def restore_thread_affinity(previous, logger: logging.Logger):
+    """Undo pin_current_thread on the same thread"""
+    if previous is None:
+        return
+    try:
+        if isinstance(previous, int):
+            _set_thread_affinity_mask(previous)
+        else:
+            os.sched_setaffinity(0, previous)
+    except OSError as e:
+        logger.warning(f"Could not restore thread affinity: {e}")
+
+
+class KeepAliveTransport:
+    """Which keep-alive transport to use, with the SNMP-to-TCP fallback policy
+
+    "tcp" sends SBPL over TCP; "udp-snmp" sends an SNMP GET over UDP and
+    switches to "tcp" for good after SNMP_MAX_FAILURES failures in a row.
+    """
+
+    def __init__(self, name: str = "tcp"):
+        if name not in ("tcp", "udp-snmp"):
+            raise ValueError(f"Unknown keep-alive transport: {name}")
+        self.name = name
+        self.snmp_failures = 0
+
+    def snmp_succeeded(self):
+        """Record a successful SNMP keep-alive"""
+        self.snmp_failures = 0
+
+    def snmp_failed(self) -> bool:
+        """Record a failed SNMP keep-alive; return True if it fell back to TCP"""
+        self.snmp_failures += 1
+        if self.snmp_failures < SNMP_MAX_FAILURES:
+            return False
+        self.fall_back_to_tcp()
+        return True
+
+    def fall_back_to_tcp(self):
+        """Switch to the TCP/SBPL keep-alive for good"""
+        self.name = "tcp"
+
+
+def find_printer_port(
+    ip: str, timeout: int = 2, verbose: bool = True
+) -> Tuple[List[int], Optional[int]]:
+    """Scan the printer ports and probe each open one in a single pass
+
+    Every port is connected at once; as soon as a connect completes the
+    keep-alive command is sent on that same socket. Returns the open ports
+    seen and the most preferred port that accepted the command (or None).
+    The scan stops early once that port is known, so the open port list can
+    be incomplete when a working port is found. Only the SBPL keep-alive is
+    probed; test_printer_communication also tries the fallback commands.
+    """
+    # None = undecided, True = accepted keep-alive, False = closed/failed
+    accepted = dict.fromkeys(_COMMON_PRINTER_PORTS, None)
+    open_ports = []
+    working_port = None
+    resp_buf = bytearray(1024)  # Probe replies are only checked, never kept
+
+    if verbose:
+        print(f"Scanning and probing {ip} for printer ports...")
+    sel = None
+    try:
+        connect_deadline = time.monotonic() + timeout
+        # data: [port, deadline, probing]
+        sel = _start_connects(
+            ip, _COMMON_PRINTER_PORTS, lambda port: [port, connect_deadline, False]
+        )
+        pending = {key.data[0] for key in sel.get_map().values()}
+        for port in _COMMON_PRINTER_PORTS:
+            if port not in pending:
+                accepted[port] = False
+
+        while working_port is None and sel.get_map():
+            now = time.monotonic()
+            next_deadline = min(key.data[1] for key in sel.get_map().values())
+            for key, _ in sel.select(max(0, next_deadline - now)):
+                sock, state = key.fileobj, key.data
+                port = state[0]
+                if not state[2]:
+                    # Connect finished; SO_ERROR tells success from refusal
+                    if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+                        accepted[port] = False
+                    else:
+                        open_ports.append(port)
+                        try:
+                            sock.send(KEEPALIVE_CMD)
+                        except OSError:
+                            accepted[port] = False
+                        else:
+                            # Give the printer a moment to reply or reset
+                            state[1], state[2] = time.monotonic() + 1, True
+                            sel.modify(sock, selectors.EVENT_READ, state)
+                            continue
+                else:
+                    try:
+                        sock.recv_into(resp_buf)
+                        accepted[port] = True
+                    except OSError:
+                        accepted[port] = False
+                sel.unregister(sock)
+                sock.close()
+
+            # Expire sockets past their deadline
+            now = time.monotonic()
+            for key in list(sel.get_map().values()):
+                if key.data[1] <= now:
+                    # A silent probe still counts, no response is expected
+                    accepted[key.data[0]] = key.data[2]
+                    sel.unregister(key.fileobj)
+                    key.fileobj.close()
+
+            # Stop once the most preferred undecided port is settled
+            for port in _COMMON_PRINTER_PORTS:
+                if accepted[port] is None:
+                    break
+                if accepted[port]:
+                    working_port = port
+                    break
+    except socket.error:
+        pass
+    finally:
+        if sel is not None:
+            _close_selector(sel)
+
+    # Connects complete in any order; report ports by preference
+    open_ports.sort(key=_COMMON_PRINTER_PORTS.index)
+    if verbose:
+        for port in _COMMON_PRINTER_PORTS:
+            if accepted[port]:
+                print(f"  Port {port}: OPEN, keep-alive accepted")
+            elif port in open_ports:
+                print(f"  Port {port}: OPEN, keep-alive failed")
+            elif accepted[port] is False:
+                print(f"  Port {port}: CLOSED")
+    return open_ports, working_port
+
+
 class PrinterKeepAlive:
-    def __init__(self, printer_ip: str, printer_port: int = 9100, interval: int = 30):
+    def __init__(
+        self,
+        printer_ip: str,
+        printer_port: int = 9100,
+        interval: int = 30,
+        preferred_core: Optional[int] = None,
+        transport: str = "tcp",
+    ):
         self.printer_ip = printer_ip
         self.printer_port = printer_port
         self.interval = interval
-        self.keepalive_command = b"\x1b@\x1bA\x1bZ"  # SBPL keep-alive
+        self._transport = KeepAliveTransport(transport)
+        # CPU the thread calling run() is pinned to while it runs (None
+        # disables pinning)
+        self.preferred_core = preferred_core
         self.running = False
-        self.last_success = None
+        self._stop = threading.Event()
+        # Self-pipe so stop() and Ctrl-C can wake run() out of a selector wait;
+        # created by run() and closed when it returns
+        self._rsock: Optional[socket.socket] = None
+        self._wsock: Optional[socket.socket] = None
+        self._sel: Optional[selectors.BaseSelector] = None
+        self._prev_wakeup_fd: Optional[int] = None
+        # time.monotonic() readings; converted to wall-clock only in get_status
+        self._start_monotonic: Optional[float] = None
+        self._last_success_monotonic: Optional[float] = None
+        # get_status strings, recomputed only when their inputs change
+        self._status_success_key: Optional[float] = None
+        self._status_success_iso: Optional[str] = None
+        self._status_uptime_key: Optional[Tuple[float, int]] = None
+        self._status_uptime: Optional[str] = None
         self.consecutive_failures = 0
         self.max_failures = 10
+        self._addrinfo = None  # Resolved once, on first connect
+        self._udp_sock: Optional[socket.socket] = None
 
-        # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            handlers=[
-                logging.FileHandler("printer_keepalive.log"),
-                logging.StreamHandler(sys.stdout),
-            ],
-        )
+        setup_logging()
         self.logger = logging.getLogger(__name__)
 
-    def test_connection(self) -> bool:
-        """Test if printer is reachable"""
+    @property
+    def transport(self) -> str:
+        """Keep-alive transport currently in use ("tcp" or "udp-snmp")"""
+        return self._transport.name
+
+    def _open_socket(self) -> socket.socket:
+        """Connect to the printer using the cached address resolution"""
+        if self._addrinfo is None:
+            self._addrinfo = socket.getaddrinfo(
+                self.printer_ip, self.printer_port, type=socket.SOCK_STREAM
+            )[0]
+        family, socktype, proto, _, addr = self._addrinfo
+        sock = socket.socket(family, socktype, proto)
         try:
-            with socket.create_connection(
-                (self.printer_ip, self.printer_port), timeout=5
-            ) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(addr)
+        except Exception:
+            sock.close()
+            # Resolve again next time in case the printer's address changed
+            self._addrinfo = None
+            raise
+        return sock
+
+    def test_connection(self) -> bool:
+        """Test if printer is reachable over the configured transport"""
+        snmp_failed = False
+        if self.transport == "udp-snmp":
+            try:
+                self._send_snmp()
                 return True
+            except Exception as e:
+                self._close_udp_socket()
+                snmp_failed = True
+                # TCP is the fallback transport, so it is good enough to start
+                self.logger.warning(f"SNMP connection test failed: {e}. Trying TCP...")
+        try:
+            with self._open_socket():
+                pass
         except Exception as e:
             self.logger.error(f"Connection test failed: {e}")
             return False
+        if snmp_failed:
+            # Start on TCP rather than failing the first few SNMP ticks
+            self.logger.warning("SNMP unavailable at startup. Using TCP keep-alive.")
+            self._transport.fall_back_to_tcp()
+        return True
+
+    def _connect(self) -> socket.socket:
+        """Open a TCP connection to the printer ready for the keep-alive send"""
+        sock = self._open_socket()
+        try:
+            configure_socket(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _sendall(self, sock: socket.socket):
+        """Send the SBPL keep-alive under the send timeout"""
+        sock.settimeout(SEND_TIMEOUT)
+        sock.sendall(KEEPALIVE_CMD)
+
+    def _send_tcp(self):
+        """Connect, send the SBPL keep-alive and close
+
+        Raw print ports usually serve one session at a time, so the connection
+        is never held between ticks; that would block real print jobs.
+        """
+        with self._connect() as sock:
+            self._sendall(sock)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self._log_response(sock)
+
+    def _log_response(self, sock: socket.socket):
+        """Read and log any acknowledgment the printer sends (diagnostics only)"""
+        if hasattr(socket, "TCP_QUICKACK"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        try:
+            response = sock.recv(1024)
+        except socket.timeout:
+            return  # No response expected for keep-alive
+        if response:
+            self.logger.debug(f"Printer response: {response[:20]}")
+
+    def _close_udp_socket(self):
+        """Close the SNMP socket, if any"""
+        if self._udp_sock is not None:
+            self._udp_sock.close()
+            self._udp_sock = None
+
+    def _send_snmp(self):
+        """Send an SNMP sysUpTime GET and wait for any reply"""
+        if self._udp_sock is None:
+            self._udp_sock = open_snmp_socket(self.printer_ip)
+        send_snmp_probe(self._udp_sock)
 
     def send_keepalive(self) -> bool:
-        """Send keep-alive command to printer"""
+        """Send keep-alive command to printer over the configured transport"""
         try:
-            with socket.create_connection(
-                (self.printer_ip, self.printer_port), timeout=5
-            ) as sock:
-                sock.sendall(self.keepalive_command)
-                sock.settimeout(2)  # Wait for any response/acknowledgment
+            if self.transport == "udp-snmp":
                 try:
-                    # Try to read any response (some printers send ACK)
-                    response = sock.recv(1024)
-                except socket.timeout:
-                    pass  # No response expected for keep-alive
+                    self._send_snmp()
+                    self._transport.snmp_succeeded()
+                except Exception as e:
+                    self._close_udp_socket()
+                    if not self._transport.snmp_failed():
+                        raise
+                    self.logger.warning(
+                        f"SNMP keep-alive failed {self._transport.snmp_failures} times ({e}). "
+                        "Falling back to TCP."
+                    )
 
-                self.last_success = datetime.now()
-                self.consecutive_failures = 0
-                return True
+            if self.transport == "tcp":
+                self._send_tcp()
+
+            self._last_success_monotonic = time.monotonic()
+            self.consecutive_failures = 0
+            return True
 
         except Exception as e:
             self.consecutive_failures += 1
@@ -111,26 +567,98 @@ class PrinterKeepAlive:
             )
             return False
 
+    @staticmethod
+    def _to_datetime(monotonic: Optional[float]) -> Optional[datetime]:
+        """Convert a time.monotonic() reading to wall-clock time"""
+        if monotonic is None:
+            return None
+        return datetime.now() - timedelta(seconds=time.monotonic() - monotonic)
+
+    @property
+    def last_success(self) -> Optional[datetime]:
+        """Wall-clock time of the last successful keep-alive, or None"""
+        return self._to_datetime(self._last_success_monotonic)
+
+    @property
+    def start_time(self) -> Optional[datetime]:
+        """Wall-clock time run() last started, or None"""
+        return self._to_datetime(self._start_monotonic)
+
     def get_status(self) -> dict:
         """Get current status of the keep-alive service"""
+        now = time.monotonic()
+        if self._last_success_monotonic != self._status_success_key:
+            self._status_success_key = self._last_success_monotonic
+            last_success = self.last_success
+            self._status_success_iso = (
+                last_success.isoformat() if last_success is not None else None
+            )
+        if self._start_monotonic is None:
+            self._status_uptime = None
+        elif (self._start_monotonic, int(now)) != self._status_uptime_key:
+            # Frequent pollers reuse the formatted uptime within the same second
+            self._status_uptime_key = (self._start_monotonic, int(now))
+            self._status_uptime = str(timedelta(seconds=now - self._start_monotonic))
         return {
             "running": self.running,
             "printer_ip": self.printer_ip,
-            "last_success": (
-                self.last_success.isoformat() if self.last_success else None
-            ),
+            "last_success": self._status_success_iso,
             "consecutive_failures": self.consecutive_failures,
-            "uptime": (
-                str(datetime.now() - self.start_time)
-                if hasattr(self, "start_time")
-                else None
-            ),
+            "uptime": self._status_uptime,
         }
 
+    def _open_wakeup(self):
+        """Create the self-pipe and selector that run() waits on"""
+        self._rsock, self._wsock = socket.socketpair()
+        self._rsock.setblocking(False)
+        self._wsock.setblocking(False)
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(self._rsock, selectors.EVENT_READ)
+        if threading.current_thread() is threading.main_thread():
+            # select() is not interrupted by Ctrl-C on Windows; have signals
+            # write to the self-pipe so the wait still wakes up
+            self._prev_wakeup_fd = signal.set_wakeup_fd(self._wsock.fileno())
+
+    def _close_wakeup(self):
+        """Undo _open_wakeup"""
+        if self._prev_wakeup_fd is not None:
+            signal.set_wakeup_fd(self._prev_wakeup_fd)
+            self._prev_wakeup_fd = None
+        self._sel.close()
+        self._rsock.close()
+        self._wsock.close()
+        self._sel = self._rsock = self._wsock = None
+
+    def _wait(self, timeout: float) -> bool:
+        """Wait up to timeout seconds; return True if stop() was requested"""
+        deadline = time.monotonic() + timeout
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._sel.select(remaining):
+                # Drain the wake-up bytes (stop() or a signal)
+                try:
+                    self._rsock.recv(64)
+                except OSError:
+                    pass
+        return True
+
     def run(self):
         """Main keep-alive loop"""
+        previous_affinity = pin_current_thread(self.preferred_core, self.logger)
+        try:
+            self._run()
+        finally:
+            # Leave the caller's thread with the affinity it had before
+            restore_thread_affinity(previous_affinity, self.logger)
+
+    def _run(self):
+        """Body of run(), executed while the thread is pinned"""
+        # Clear a stop() from a previous run so the instance can be restarted
+        self._stop.clear()
         self.running = True
-        self.start_time = datetime.now()
+        self._start_monotonic = time.monotonic()
         self.logger.info(
             f"Starting keep-alive service for printer {self.printer_ip}:{self.printer_port}"
         )
@@ -140,32 +668,46 @@ class PrinterKeepAlive:
             self.logger.error("Initial connection test failed. Exiting.")
             return
 
-        while self.running:
-            try:
-                if self.send_keepalive():
-                    self.logger.info("Keep-alive sent successfully")
-                else:
-                    if self.consecutive_failures >= self.max_failures:
-                        self.logger.error(
-                            f"Max failures ({self.max_failures}) reached. Stopping service."
-                        )
-                        break
+        self._open_wakeup()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self.send_keepalive():
+                        self.logger.info("Keep-alive sent successfully")
+                    else:
+                        if self.consecutive_failures >= self.max_failures:
+                            self.logger.error(
+                                f"Max failures ({self.max_failures}) reached. Stopping service."
+                            )
+                            break
 
-                time.sleep(self.interval)
+                    if self._wait(self.interval):
+                        break
 
-            except KeyboardInterrupt:
-                self.logger.info("Received interrupt signal. Stopping...")
-                break
-            except Exception as e:
-                self.logger.error(f"Unexpected error: {e}")
-                time.sleep(5)  # Wait before retry
+                except KeyboardInterrupt:
+                    self.logger.info("Received interrupt signal. Stopping...")
+                    break
+                except Exception as e:
+                    self.logger.error(f"Unexpected error: {e}")
+                    if self._wait(5):  # Wait before retry
+                        break
+        finally:
+            self._close_wakeup()
 
         self.running = False
+        self._close_udp_socket()
         self.logger.info("Keep-alive service stopped")
 
     def stop(self):
         """Stop the keep-alive service"""
-        self.running = False
+        self._stop.set()
+        wsock = self._wsock
+        if wsock is None:
+            return  # run() is not waiting; it checks the stop flag first
+        try:
+            wsock.send(b"x")
+        except OSError:
+            pass  # Buffer full, or run() just closed the pipe
 
 
 # Configuration
@@ -174,28 +716,25 @@ PRINTER_PORT = 9100
 KEEPALIVE_INTERVAL = 30  # seconds
 
 if __name__ == "__main__":
-    # First, discover available ports on the printer
-    print(f"Discovering printer ports on {PRINTER_IP}...")
-    open_ports = discover_printer_ports(PRINTER_IP)
-    
+    # Discover open ports and probe them with the keep-alive command in one pass
+    open_ports, working_port = find_printer_port(PRINTER_IP)
+
     if not open_ports:
         print(f"No open ports found on {PRINTER_IP}. Please check:")
         print("1. The IP address is correct")
         print("2. The printer is powered on and connected to the network")
         print("3. Your computer can reach the printer (try ping)")
         sys.exit(1)
-    
-    print(f"\nFound {len(open_ports)} open port(s): {open_ports}")
-    
-    # Test communication on each port
-    working_port = None
-    for port in open_ports:
-        if test_printer_communication(PRINTER_IP, port):
-            working_port = port
-            print(f"\n✓ Port {port} appears to work for printer communication!")
-            break
-    
+
+    if not working_port:
+        # Retry the open ports with the fallback probe commands
+        for port in open_ports:
+            if test_printer_communication(PRINTER_IP, port):
+                working_port = port
+                break
+
     if working_port:
+        print(f"\n✓ Port {working_port} appears to work for printer communication!")
         # Ask user if they want to use the discovered port
         response = input(f"\nUse port {working_port}? (y/n, default: y): ").strip().lower()
         if response in ('', 'y', 'yes'):
@@ -1,33 +1,30 @@
 import win32serviceutil
 import win32service
-import win32event
 import servicemanager
+import asyncio
 import socket
-import time
 import logging
-from datetime import datetime
 import sys
 import os
-from typing import List
+from typing import List, Optional, Tuple
 
+from keepalive import (
+    CONNECT_TIMEOUT,
+    KEEPALIVE_CMD,
+    SEND_TIMEOUT,
+    SNMP_GET_UPTIME,
+    KeepAliveTransport,
+    configure_socket,
+    discover_printer_ports,
+    open_snmp_socket,
+    pin_current_thread,
+    send_snmp_probe,
+    setup_logging,
+    stop_logging,
+)
 
-def discover_printer_ports(ip: str, timeout: int = 2) -> List[int]:
-    """Discover open ports on the printer"""
-    common_printer_ports = [9100, 631, 515, 721, 9101, 9102, 9103, 23, 80, 443]
-    open_ports = []
-
-    for port in common_printer_ports:
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            result = sock.connect_ex((ip, port))
-            if result == 0:
-                open_ports.append(port)
-            sock.close()
-        except:
-            pass
-
-    return open_ports
+# Interval multiplier indexed by consecutive failures; the last entry is the cap
+_BACKOFF_MULTIPLIERS = (1, 1, 1, 1, 2, 2, 2, 4)
 
 
 class PrinterKeepAliveService(win32serviceutil.ServiceFramework):
@@ -39,52 +36,60 @@ class PrinterKeepAliveService(win32serviceutil.ServiceFramework):
 
     def __init__(self, args):
         win32serviceutil.ServiceFramework.__init__(self, args)
-        self.hWaitStop = win32event.CreateEvent(None, 0, 0, None)
         self.is_running = True
 
         # Configuration - can be read from config file or registry
         self.printer_ip = "192.168.1.27"
         self.printer_port = 9100
         self.interval = 30  # seconds
-        self.keepalive_command = b"\x1b@\x1bA\x1bZ"
+        # "tcp" sends SBPL over TCP; "udp-snmp" sends an SNMP GET over UDP and
+        # falls back to TCP after repeated failures
+        self.keepalive_transport = "tcp"
         self.max_failures = 10
-        self.consecutive_failures = 0
+        # CPU the service thread is pinned to, ideally the core that handles the
+        # NIC's receive interrupts (see Get-NetAdapterRss). None (the default)
+        # disables pinning.
+        self.preferred_core = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
 
         # Setup logging with proper service-friendly paths
         log_dir = r"C:\Logs\ToshibaPrinterKeepAlive"
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+        os.makedirs(log_dir, exist_ok=True)
         log_path = os.path.join(log_dir, "printer_keepalive_service.log")
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            handlers=[logging.FileHandler(log_path)],  # Removed console handler for service
-        )
+        # No console handler for service
+        setup_logging([logging.FileHandler(log_path)])
         self.logger = logging.getLogger(__name__)
 
         # Auto-discover port if default doesn't work
         if not self.test_connection():
             self.logger.info("Default port not responding, attempting auto-discovery...")
-            open_ports = discover_printer_ports(self.printer_ip)
+            open_ports = discover_printer_ports(self.printer_ip, verbose=False)
             if open_ports:
                 self.printer_port = open_ports[0]
                 self.logger.info(f"Auto-discovered printer port: {self.printer_port}")
 
-    def get_retry_delay(self):
+        # Printers served by this service; append (ip, port) pairs to add more
+        self.printers: List[Tuple[str, int]] = [(self.printer_ip, self.printer_port)]
+
+    def get_retry_delay(self, consecutive_failures: int):
         """Get delay based on consecutive failures (exponential backoff)"""
-        if self.consecutive_failures <= 3:
-            return self.interval
-        elif self.consecutive_failures <= 6:
-            return self.interval * 2
-        else:
-            return self.interval * 4  # Max delay
+        return self.interval * _BACKOFF_MULTIPLIERS[
+            min(consecutive_failures, len(_BACKOFF_MULTIPLIERS) - 1)
+        ]
 
     def SvcStop(self):
         self.ReportServiceStatus(win32service.SERVICE_STOP_PENDING)
-        self.is_running = False
-        win32event.SetEvent(self.hWaitStop)
+        # Log first: once the loop wakes, SvcDoRun may stop the log listener
         self.logger.info("Service stop requested")
+        self.is_running = False
+        # Wake every printer coroutine waiting on the event loop
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # main() closed the loop meanwhile; nothing left to wake
 
     def SvcDoRun(self):
         servicemanager.LogMsg(
@@ -94,27 +99,121 @@ class PrinterKeepAliveService(win32serviceutil.ServiceFramework):
         )
 
         self.logger.info("Starting Toshiba Printer Keep-Alive Service")
-        self.main()
+        pin_current_thread(self.preferred_core, self.logger)
+        try:
+            self.main()
+        finally:
+            # Flush queued records before the service process exits
+            stop_logging()
 
-    def send_keepalive(self):
-        """Send keep-alive command to printer"""
+    async def _open_connection(self, addrinfo) -> socket.socket:
+        """Open a configured, non-blocking TCP connection to the printer"""
+        family, socktype, proto, _, addr = addrinfo
+        sock = socket.socket(family, socktype, proto)
+        sock.setblocking(False)
         try:
-            with socket.create_connection(
-                (self.printer_ip, self.printer_port), timeout=5
-            ) as sock:
-                sock.sendall(self.keepalive_command)
-                self.consecutive_failures = 0
-                return True
-        except Exception as e:
-            self.consecutive_failures += 1
-            self.logger.error(f"Keep-alive failed (attempt {self.consecutive_failures}): {e}")
-            return False
+            await asyncio.wait_for(
+                self._loop.sock_connect(sock, addr), CONNECT_TIMEOUT
+            )
+            configure_socket(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def _send_keepalive(self, addrinfo):
+        """Connect, send the keep-alive command and close
+
+        Raw print ports usually serve one session at a time, so the connection
+        is never held between ticks; that would block real print jobs.
+        """
+        with await self._open_connection(addrinfo) as sock:
+            await asyncio.wait_for(
+                self._loop.sock_sendall(sock, KEEPALIVE_CMD), SEND_TIMEOUT
+            )
+
+    async def _send_snmp(self, ip: str, udp_sock):
+        """Send an SNMP sysUpTime GET and wait for any reply"""
+        if udp_sock is None:
+            udp_sock = open_snmp_socket(ip)
+            udp_sock.setblocking(False)
+        try:
+            await self._loop.sock_sendall(udp_sock, SNMP_GET_UPTIME)
+            await asyncio.wait_for(
+                self._loop.sock_recv(udp_sock, 1500), CONNECT_TIMEOUT
+            )
+        except BaseException:
+            udp_sock.close()
+            raise
+        return udp_sock
+
+    async def _keepalive_loop(self, ip: str, port: int):
+        """Keep one printer awake until the service is stopped"""
+        addrinfo = None  # Resolved once, on first connect
+        transport = KeepAliveTransport(self.keepalive_transport)
+        udp_sock = None
+        consecutive_failures = 0
+        # Recomputed only when the failure count changes
+        delay = self.get_retry_delay(0)
+
+        while self.is_running:
+            try:
+                if transport.name == "udp-snmp":
+                    try:
+                        udp_sock = await self._send_snmp(ip, udp_sock)
+                        transport.snmp_succeeded()
+                    except Exception as e:
+                        udp_sock = None
+                        if not transport.snmp_failed():
+                            raise
+                        self.logger.warning(
+                            f"SNMP keep-alive to {ip} failed {transport.snmp_failures} times ({e}). Falling back to TCP."
+                        )
+
+                if transport.name == "tcp":
+                    if addrinfo is None:
+                        addrinfo = (
+                            await self._loop.getaddrinfo(ip, port, type=socket.SOCK_STREAM)
+                        )[0]
+                    await self._send_keepalive(addrinfo)
+                if consecutive_failures:
+                    consecutive_failures = 0
+                    delay = self.get_retry_delay(0)
+                self.logger.debug(f"Keep-alive sent successfully to {ip}:{port}")
+            except Exception as e:
+                # Resolve again next tick in case the printer's address changed
+                addrinfo = None
+                consecutive_failures += 1
+                # Use exponential backoff for retry delay
+                delay = self.get_retry_delay(consecutive_failures)
+                self.logger.warning(
+                    f"Keep-alive to {ip}:{port} failed ({consecutive_failures} consecutive failures): {e}"
+                )
+
+                if consecutive_failures >= self.max_failures:
+                    self.logger.error(f"Max failures ({self.max_failures}) reached for {ip}:{port}. Will keep trying...")
+
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+        if udp_sock is not None:
+            udp_sock.close()
 
     def test_connection(self):
-        """Test if printer is reachable"""
+        """Test if printer is reachable over the configured transport"""
+        if self.keepalive_transport == "udp-snmp":
+            try:
+                with open_snmp_socket(self.printer_ip) as sock:
+                    send_snmp_probe(sock)
+                return True
+            except Exception as e:
+                self.logger.warning(f"SNMP connection test failed: {e}. Trying TCP...")
         try:
             with socket.create_connection(
-                (self.printer_ip, self.printer_port), timeout=5
+                (self.printer_ip, self.printer_port), timeout=CONNECT_TIMEOUT
             ) as sock:
                 return True
         except Exception as e:
@@ -131,34 +230,22 @@ class PrinterKeepAliveService(win32serviceutil.ServiceFramework):
         if not self.test_connection():
             self.logger.error("Initial connection test failed. Service will retry...")
 
-        while self.is_running:
-            # Check if stop event is set (non-blocking)
-            if (
-                win32event.WaitForSingleObject(self.hWaitStop, 0)
-                == win32event.WAIT_OBJECT_0
-            ):
-                break
-
-            try:
-                if self.send_keepalive():
-                    self.logger.debug("Keep-alive sent successfully")
-                else:
-                    self.logger.warning(f"Keep-alive failed ({self.consecutive_failures} consecutive failures)")
-                    
-                    if self.consecutive_failures >= self.max_failures:
-                        self.logger.error(f"Max failures ({self.max_failures}) reached. Will keep trying...")
-
-                # Use exponential backoff for retry delay
-                delay = self.get_retry_delay()
-                if (
-                    win32event.WaitForSingleObject(self.hWaitStop, int(delay * 1000))
-                    == win32event.WAIT_OBJECT_0
-                ):
-                    break
-
-            except Exception as e:
-                self.logger.error(f"Unexpected error: {e}")
-                time.sleep(5)
+        # One event loop multiplexes every configured printer on this thread
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._stop_event = asyncio.Event()
+        self._loop = loop
+        try:
+            tasks = [
+                loop.create_task(self._keepalive_loop(ip, port))
+                for ip, port in self.printers
+            ]
+            loop.run_until_complete(asyncio.gather(*tasks))
+        except Exception as e:
+            self.logger.error(f"Unexpected error: {e}")
+        finally:
+            self._loop = None
+            loop.close()
 
         self.logger.info("Keep-alive service stopped")
 